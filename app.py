@@ -1,25 +1,35 @@
-from flask import Flask, render_template, request, send_file, jsonify, Response, stream_with_context
-from pydub import AudioSegment
+from flask import Flask, Request, render_template, request, send_file, jsonify, Response
+from werkzeug.wsgi import LimitedStream
 import os
-from werkzeug.utils import secure_filename
-import tempfile
+import sys
 from flask_cors import CORS
 import logging
-import traceback
-import uuid
+import secrets
+import io
+import tempfile
 from pathlib import Path
 import subprocess
 import shutil
 import re
-import gc
 import psutil
-from rq import Queue
-from redis import Redis
+from rq import Queue, get_current_job
+from redis import BlockingConnectionPool, Redis
 import time
+import threading
+import selectors
+import mmap
+import struct
+from contextlib import contextmanager
+from collections import deque
 
-# Configure logging
+try:
+    import fcntl
+except ImportError:  # Windows development setup
+    fcntl = None
+
+# Configure logging (LOG_LEVEL=WARNING in production)
 logging.basicConfig(
-    level=logging.INFO,
+    level=os.environ.get('LOG_LEVEL', 'INFO').upper(),
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
 )
 logger = logging.getLogger(__name__)
@@ -29,7 +39,7 @@ CORS(app, resources={
     r"/*": {
         "origins": "*",
         "methods": ["GET", "POST"],
-        "allow_headers": ["Content-Type"]
+        "allow_headers": ["Content-Type", "X-Filename"]
     }
 })
 
@@ -41,162 +51,1048 @@ if not redis_url:
     USE_REDIS = False
 else:
     try:
-        redis_conn = Redis.from_url(redis_url)
+        # Threads wait for a free connection instead of opening unbounded ones
+        redis_pool = BlockingConnectionPool.from_url(redis_url, max_connections=32, timeout=5)
+        redis_conn = Redis(connection_pool=redis_pool)
         redis_conn.ping()  # Test connection
         queue = Queue(connection=redis_conn)
         USE_REDIS = True
         logger.info("Successfully connected to Redis")
     except Exception as e:
-        logger.error(f"Failed to connect to Redis: {str(e)}")
+        logger.error("Failed to connect to Redis: %s", e)
         USE_REDIS = False
 
+app.config['MAX_CONTENT_LENGTH'] = 100 * 1024 * 1024  # 100MB max file size
+
 # Set up temporary directory
-TEMP_DIR = Path("/app/temp")
+# Every web process and RQ worker must agree on this directory, so it is
+# configuration only; mount a tmpfs here to keep temp files off the disk
+TEMP_DIR = Path(os.environ.get('TEMP_DIR', '/app/temp'))
 if not TEMP_DIR.exists():
     TEMP_DIR.mkdir(parents=True)
+logger.info("Using temp dir: %s", TEMP_DIR)
 
 app.config['UPLOAD_FOLDER'] = str(TEMP_DIR)
-app.config['MAX_CONTENT_LENGTH'] = 100 * 1024 * 1024  # 100MB max file size
 
-def get_ffmpeg_path():
+class UploadRequest(Request):
+    """Request that spools multipart file uploads straight into TEMP_DIR.
+
+    Werkzeug's default spools them to the system temp dir, which meant every
+    upload was written once there and again when copied into TEMP_DIR.
+    """
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return tempfile.NamedTemporaryFile('wb+', dir=TEMP_DIR, prefix='.upload-')
+
+app.request_class = UploadRequest
+
+# FFmpeg output format for each supported upload extension
+OUTPUT_FORMATS = {'.mp3': 'mp3', '.wav': 'wav'}
+ALLOWED_EXTENSIONS = frozenset(OUTPUT_FORMATS)
+MIMETYPES = {'mp3': 'audio/mpeg', 'wav': 'audio/wav'}
+_UNSAFE_FILENAME_CHARS = re.compile(r'[^A-Za-z0-9._-]+')
+
+# nginx "internal" location that maps to TEMP_DIR, used for X-Accel-Redirect
+ACCEL_REDIRECT_PREFIX = os.environ.get('ACCEL_REDIRECT_PREFIX', '/internal-temp/')
+# Seconds to keep job results and delivered files, so an interrupted download
+# can be resumed with a Range request instead of reprocessing the upload
+RESULT_TTL = 300
+INPUT_TTL = 1800  # Seconds an upload may wait in Redis for a worker
+# Total bytes of uploads that may wait in Redis at once; beyond it new uploads
+# get a 503 instead of growing Redis memory with the backlog
+MAX_QUEUED_BYTES = int(os.environ.get('MAX_QUEUED_BYTES', 512 * 1024 * 1024))
+# Uploads waiting in Redis: input key -> expiry time, and input key -> size
+QUEUED_UPLOADS_KEY = 'in:queued'
+QUEUED_SIZES_KEY = 'in:queued-sizes'
+# Temp files older than this were left behind by a crashed request or job
+TEMP_FILE_MAX_AGE = 30 * 60
+JANITOR_INTERVAL = 60  # Seconds between temp dir sweeps
+
+def _usable_cpus():
+    """Count the CPUs this process may run on; a container cpuset can be smaller than os.cpu_count()"""
+    if hasattr(os, 'sched_getaffinity'):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 2
+
+# Cap concurrent FFmpeg processes per host so parallel requests queue up
+# instead of oversubscribing the CPU (slots * threads ~= usable cpus).
+# Set FFMPEG_THREADS=1 on small plans to keep each transcode on one core.
+USABLE_CPUS = _usable_cpus()
+FFMPEG_SLOTS = int(os.environ.get('FFMPEG_SLOTS', max(1, USABLE_CPUS // 2)))
+FFMPEG_THREADS = int(os.environ.get('FFMPEG_THREADS', max(1, USABLE_CPUS // FFMPEG_SLOTS)))
+# The filter graph is where the time goes, so thread it as well as the codec
+FILTER_THREAD_ARGS = [
+    '-filter_threads', str(FFMPEG_THREADS),
+    '-filter_complex_threads', str(FFMPEG_THREADS)
+]
+_ffmpeg_semaphore = threading.BoundedSemaphore(FFMPEG_SLOTS)
+
+# MP3/WAV headers describe the stream up front, so skip FFmpeg's default
+# multi-megabyte probe before the first frame is decoded, and don't hold
+# back the packets that were read while probing
+FAST_PROBE_ARGS = ['-probesize', '32', '-analyzeduration', '0', '-fflags', '+nobuffer']
+
+MAX_DURATION = 12 * 60  # 12 minutes in seconds
+# Below the 10 minute RQ job timeout, so the watchdog kills FFmpeg before RQ
+# kills the job and leaves FFmpeg running
+FFMPEG_TIMEOUT = 540
+HEADER_TIMEOUT = 30  # Seconds FFmpeg may take to read the input header
+MEMORY_CHECK_INTERVAL = 5  # Seconds between psutil samples
+HEADER_PEEK_SIZE = 64 * 1024  # Start of a piped upload read to measure its duration
+COPY_BUFFER_SIZE = 4 * 1024 * 1024  # Upload copy chunk; Werkzeug's save() uses 16KB
+STREAM_CHUNK_SIZE = 64 * 1024  # Matches the Linux pipe buffer
+_DURATION_RE = re.compile(r"Duration: (\d{2}):(\d{2}):(\d{2}\.\d+)")
+
+# MPEG audio sample rates by version bits, then by sample rate index
+MP3_SAMPLE_RATES = {
+    3: (44100, 48000, 32000),  # MPEG-1
+    2: (22050, 24000, 16000),  # MPEG-2
+    0: (11025, 12000, 8000),  # MPEG-2.5
+}
+# Layer III bitrates in kbps by bitrate index, for MPEG-2/2.5 and MPEG-1
+MP3_BITRATES = {
+    False: (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+    True: (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320),
+}
+DEFAULT_SAMPLE_RATE = 44100
+# asetrate raises the pitch by playing faster, so it shortens the output too
+PITCH_SHIFT = 1.25
+
+def _resolve_ffmpeg():
     """Get the appropriate FFmpeg path based on environment"""
-    if os.environ.get('RAILWAY_STATIC_URL'):
-        return "ffmpeg"
-    
-    # Local development setup
-    possible_paths = [
-        r"C:\Program Files\ffmpeg\bin\ffmpeg.exe",
-        r"C:\ffmpeg\bin\ffmpeg.exe",
-    ]
-    
-    for path in possible_paths:
-        if os.path.exists(path):
-            return path
-    
-    return "ffmpeg"  # Default to system PATH
+    ffmpeg_path = shutil.which("ffmpeg")
+    if ffmpeg_path:
+        return ffmpeg_path
+
+    if sys.platform == "win32":
+        # Local development setup
+        possible_paths = [
+            r"C:\Program Files\ffmpeg\bin\ffmpeg.exe",
+            r"C:\ffmpeg\bin\ffmpeg.exe",
+        ]
+        for path in possible_paths:
+            if os.path.exists(path):
+                return path
+
+    return "ffmpeg"  # Let the spawn report a missing binary
+
+# Resolved once per process at import time, never in the request path
+FFMPEG_BIN = _resolve_ffmpeg()
+logger.info("Using FFmpeg at: %s", FFMPEG_BIN)
+
+class AudioTooLongError(Exception):
+    """Raised when an upload is longer than MAX_DURATION"""
 
 def get_audio_duration(file_path):
-    """Get the duration of an audio file in seconds using FFmpeg"""
+    """Read the duration of a WAV or MP3 file from its headers, or None if unknown"""
+    with open(file_path, 'rb') as f:
+        return read_audio_duration(f, os.fstat(f.fileno()).st_size, file_path.lower().endswith('.wav'))
+
+def read_audio_duration(f, file_size, is_wav):
+    """Read the duration of WAV or MP3 data from its headers, or None if unknown.
+
+    f is a seekable binary file positioned at the start of the audio; it only
+    needs to hold the headers, with file_size giving the length of the whole.
+    MP3 durations come from the Xing/Info or VBRI frame count when the encoder
+    wrote one, and are estimated from the bitrate otherwise (as ffprobe does).
+    """
+    if is_wav:
+        return _wav_duration(f, file_size)
+
+    frame = _first_mp3_frame(f)
+    if frame is None:
+        return None
+
+    offset, data = frame
+    version = (data[1] >> 3) & 0x3
+    if (data[1] >> 1) & 0x3 != 1 or len(data) < 64:
+        return None  # Not Layer III
+    sample_rate = MP3_SAMPLE_RATES[version][(data[2] >> 2) & 0x3]
+    samples_per_frame = 1152 if version == 3 else 576
+    mono = data[3] >> 6 == 3
+    if version == 3:
+        side_info = 17 if mono else 32
+    else:
+        side_info = 9 if mono else 17
+
+    # VBR encoders store the frame count in a tag inside the first frame
+    xing = 4 + side_info
+    if data[xing:xing + 4] in (b'Xing', b'Info'):
+        flags, frames = struct.unpack_from('>II', data, xing + 4)
+        if flags & 0x1:
+            return frames * samples_per_frame / sample_rate
+    if data[36:40] == b'VBRI':
+        frames = struct.unpack_from('>I', data, 36 + 14)[0]
+        return frames * samples_per_frame / sample_rate
+
+    bitrates = MP3_BITRATES[version == 3]
+    bitrate = bitrates[data[2] >> 4] if data[2] >> 4 < len(bitrates) else 0
+    if not bitrate:
+        return None  # Free-format or invalid bitrate
+    return (file_size - offset) * 8 / (bitrate * 1000)
+
+def _wav_duration(f, file_size):
+    """Duration of a WAV file from its fmt and data chunks, or None if unknown"""
+    fmt = _find_wav_chunk(f, b'fmt ')
+    f.seek(0)
+    data = _find_wav_chunk(f, b'data')
+    if fmt is None or data is None or fmt[1] < 16:
+        return None
+    f.seek(fmt[0] + 4)
+    fields = f.read(10)
+    if len(fields) < 10:
+        return None
+    sample_rate, _, block_align = struct.unpack('<IIH', fields)
+    data_offset, data_size = data
+    # Streaming writers (pipes, recorders) leave a placeholder size
+    if not sample_rate or not block_align or data_size in (0, 0xFFFFFFFF):
+        return None
+    # A truncated file holds fewer frames than its header claims
+    frames = min(data_size, file_size - data_offset) // block_align
+    return frames / sample_rate
+
+def _first_mp3_frame(f, start=0):
+    """Find the first MPEG audio frame after any ID3v2 tag.
+
+    Returns (offset, data) where data is up to 4KB starting at the frame
+    header, or None. Leaves the file position wherever reading stopped.
+    """
+    f.seek(start)
+    header = f.read(10)
+    offset = start
+    if header[:3] == b'ID3' and len(header) == 10:
+        # Skip the ID3v2 tag; its size is a 28-bit syncsafe integer
+        size = header[6] << 21 | header[7] << 14 | header[8] << 7 | header[9]
+        footer = 10 if header[5] & 0x10 else 0
+        offset = start + 10 + size + footer
+    f.seek(offset)
+    data = f.read(4096)
+
+    for i in range(len(data) - 3):
+        if data[i] != 0xFF or data[i + 1] & 0xE0 != 0xE0:
+            continue
+        version = (data[i + 1] >> 3) & 0x3
+        rate_index = (data[i + 2] >> 2) & 0x3
+        if version in MP3_SAMPLE_RATES and rate_index != 3:
+            return offset + i, data[i:]
+    return None
+
+def _find_wav_chunk(f, chunk_id):
+    """Find a chunk in a RIFF/WAVE file, starting at the current position.
+
+    f is a seekable binary file (an mmap works too). Returns the offset of
+    the chunk's data and its declared size, or None if f is not a WAVE file
+    or has no such chunk.
+    """
+    start = f.tell()
+    header = f.read(12)
+    if header[:4] != b'RIFF' or header[8:12] != b'WAVE':
+        return None
+
+    # Walk the chunks: "fmt " is not always the first one
+    offset = start + 12
+    while True:
+        f.seek(offset)
+        chunk_header = f.read(8)
+        if len(chunk_header) < 8:
+            return None
+        chunk_size = struct.unpack('<I', chunk_header[4:])[0]
+        if chunk_header[:4] == chunk_id:
+            return offset + 8, chunk_size
+        offset += 8 + chunk_size + (chunk_size & 1)  # Chunks are word aligned
+
+def get_sample_rate(source):
+    """Read the sample rate from a WAV header or the first MP3 frame header, or None.
+
+    source is a path or a seekable binary file, which is rewound afterwards.
+    """
+    if isinstance(source, str):
+        with open(source, 'rb') as f:
+            return get_sample_rate(f)
+
+    start = source.tell()
     try:
-        ffmpeg_path = get_ffmpeg_path()
-        cmd = [
-            ffmpeg_path,
-            "-i", file_path,
-            "-hide_banner"
-        ]
-        
-        # Run FFmpeg command to get file info
-        process = subprocess.Popen(
-            cmd,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            universal_newlines=True
-        )
-        
-        # FFmpeg prints file info to stderr
-        stdout, stderr = process.communicate()
-        
-        # Find duration in output
-        duration_match = re.search(r"Duration: (\d{2}):(\d{2}):(\d{2})", stderr)
-        if duration_match:
-            hours, minutes, seconds = map(int, duration_match.groups())
-            total_seconds = hours * 3600 + minutes * 60 + seconds
-            return total_seconds
+        header = source.read(12)
+        if header[:4] == b'RIFF' and header[8:12] == b'WAVE':
+            # Read nSamplesPerSec directly: the wave module rejects float
+            # and WAVE_FORMAT_EXTENSIBLE files
+            source.seek(start)
+            fmt = _find_wav_chunk(source, b'fmt ')
+            if fmt is None or fmt[1] < 16:
+                return None
+            source.seek(fmt[0] + 4)
+            return struct.unpack('<I', source.read(4))[0] or None
+        frame = _first_mp3_frame(source, start)
+    finally:
+        source.seek(start)
+
+    if frame is None:
         return None
-    except Exception as e:
-        logger.error(f"Error getting audio duration: {str(e)}")
+    _, data = frame
+    return MP3_SAMPLE_RATES[(data[1] >> 3) & 0x3][(data[2] >> 2) & 0x3]
+
+def parse_input_duration(line):
+    """Return the seconds in an FFmpeg "Duration:" stderr line, or None"""
+    duration_match = _DURATION_RE.search(line)
+    if not duration_match:
         return None
+    hours, minutes, seconds = duration_match.groups()
+    return int(hours) * 3600 + int(minutes) * 60 + float(seconds)
 
 def cleanup_temp_files(*files):
-    """Clean up temporary files and force garbage collection"""
+    """Clean up temporary files"""
     for file in files:
         try:
             if file and os.path.exists(file):
                 os.remove(file)
-                logger.info(f"Cleaned up temporary file: {file}")
-        except Exception as e:
-            logger.error(f"Error cleaning up file {file}: {str(e)}")
-    
-    # Force garbage collection
-    gc.collect()
-
-def check_memory_usage():
-    """Check current memory usage and log if it's high"""
-    process = psutil.Process(os.getpid())
-    memory_usage = process.memory_info().rss / 1024 / 1024  # Convert to MB
-    logger.info(f"Current memory usage: {memory_usage:.2f} MB")
-    return memory_usage
-
-def process_audio_with_ffmpeg(input_path, output_path, speed, volume):
-    """Process audio file using FFmpeg with clean remixer effect"""
+                logger.debug("Cleaned up temporary file: %s", file)
+        except Exception:
+            logger.exception("Error cleaning up file %s", file)
+
+def sweep_temp_dir():
+    """Delete files in TEMP_DIR that haven't been modified for TEMP_FILE_MAX_AGE.
+
+    Finished outputs are kept for RESULT_TTL instead, like their job results,
+    so retries and resumed downloads work until the download link expires.
+    """
+    now = time.time()
+    with os.scandir(TEMP_DIR) as entries:
+        for entry in entries:
+            # Lock files are reused for the life of the host
+            if entry.name.endswith('.lock') or not entry.is_file():
+                continue
+            # Outputs are renamed into place when complete, so mtime is when
+            # they became downloadable; a .part is still being written
+            if entry.name.startswith('output_') and not entry.name.endswith('.part'):
+                cutoff = now - RESULT_TTL
+            else:
+                cutoff = now - TEMP_FILE_MAX_AGE
+            try:
+                if entry.stat().st_mtime < cutoff:
+                    os.remove(entry.path)
+                    logger.info("Removed stale temp file: %s", entry.path)
+            except FileNotFoundError:
+                pass  # Cleaned up by its own request in the meantime
+
+def run_janitor():
+    """Sweep TEMP_DIR every JANITOR_INTERVAL seconds, one process per host at a time"""
+    while True:
+        time.sleep(JANITOR_INTERVAL)
+        try:
+            with open(TEMP_DIR / ".janitor.lock", 'w') as lock_file:
+                if fcntl is not None:
+                    try:
+                        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    except BlockingIOError:
+                        continue  # Another process is already sweeping
+                sweep_temp_dir()
+        except Exception:
+            logger.exception("Error sweeping temp dir")
+
+class MemorySampler(threading.Thread):
+    """Sample this process's RSS every MEMORY_CHECK_INTERVAL seconds and keep the peak"""
+
+    def __init__(self):
+        super().__init__(daemon=True)
+        self.peak = 0
+        self._stopped = threading.Event()
+        self._process = psutil.Process(os.getpid())
+
+    def run(self):
+        while True:
+            self.peak = max(self.peak, self._process.memory_info().rss)
+            if self._stopped.wait(MEMORY_CHECK_INTERVAL):
+                break
+
+    def stop(self):
+        """Stop sampling and log the peak RSS seen while running"""
+        self._stopped.set()
+        self.join()
+        logger.debug("Peak memory usage: %.2f MB", self.peak / 1024 / 1024)
+
+def build_atempo_filter(speed):
+    """Build an atempo filter chain, splitting factors outside atempo's 0.5-2.0 range"""
+    stages = []
+    while speed > 2.0:
+        stages.append("atempo=2.0")
+        speed /= 2.0
+    while speed < 0.5:
+        stages.append("atempo=0.5")
+        speed /= 0.5
+    stages.append(f"atempo={speed}")
+    return ",".join(stages)
+
+def build_filter_complex(speed, volume, sample_rate=DEFAULT_SAMPLE_RATE):
+    """Build the FFmpeg filter graph for the clean remixer effect"""
+    # Complex filter for clean remixer effect:
+    # 1. Pitch shifting (asetrate, aresample)
+    # 2. Speed adjustment (atempo)
+    # 3. Dynamic compression for consistent volume
+    # 4. EQ adjustments for clarity
+    # 5. Final volume adjustment
+    return (
+        # Resampling back to the input's own rate keeps aresample a plain
+        # pitch shift instead of also converting 48kHz input to 44.1kHz
+        f"asetrate={sample_rate}*{PITCH_SHIFT},aresample={sample_rate},"  # Slight pitch up
+        f"{build_atempo_filter(speed)},"  # Speed adjustment
+        f"compand=attacks=0:points=-80/-80|-45/-45|-27/-25|0/-10|20/-7:gain=2,"  # Dynamic compression
+        f"equalizer=f=100:t=h:w=200:g=-6,"  # Reduce low rumble
+        f"equalizer=f=3000:t=h:w=200:g=4,"  # Boost presence
+        f"equalizer=f=8000:t=h:w=200:g=3,"  # Add air/brightness
+        f"volume={volume}"  # Volume adjustment
+    )
+
+def acquire_ffmpeg_slot():
+    """Block until an FFmpeg slot is free and return a handle for release_ffmpeg_slot"""
+    _ffmpeg_semaphore.acquire()
+    if fcntl is None:
+        return None
+
+    # The semaphore only covers this process; lock files in TEMP_DIR extend
+    # the limit across gunicorn workers and RQ workers on the same host
     try:
-        logger.info(f"Current memory usage: {check_memory_usage():.2f} MB")
-        
-        ffmpeg_path = 'ffmpeg'
-        logger.info(f"Using FFmpeg at: {ffmpeg_path}")
-        
-        # Complex filter for clean remixer effect:
-        # 1. Pitch shifting (asetrate, aresample)
-        # 2. Speed adjustment (atempo)
-        # 3. Dynamic compression for consistent volume
-        # 4. EQ adjustments for clarity
-        # 5. Final volume adjustment
-        filter_complex = (
-            f"asetrate=44100*1.25,aresample=44100,"  # Slight pitch up
-            f"atempo={speed},"  # Speed adjustment
-            f"compand=attacks=0:points=-80/-80|-45/-45|-27/-25|0/-10|20/-7:gain=2,"  # Dynamic compression
-            f"equalizer=f=100:t=h:w=200:g=-6,"  # Reduce low rumble
-            f"equalizer=f=3000:t=h:w=200:g=4,"  # Boost presence
-            f"equalizer=f=8000:t=h:w=200:g=3,"  # Add air/brightness
-            f"volume={volume}"  # Volume adjustment
-        )
+        while True:
+            for slot in range(FFMPEG_SLOTS):
+                lock_file = open(TEMP_DIR / f".ffmpeg-slot-{slot}.lock", 'w')
+                try:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    return lock_file
+                except BlockingIOError:
+                    lock_file.close()
+            time.sleep(0.1)
+    except BaseException:
+        _ffmpeg_semaphore.release()
+        raise
+
+def release_ffmpeg_slot(lock_file):
+    """Release a slot taken with acquire_ffmpeg_slot"""
+    try:
+        if lock_file is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+            lock_file.close()
+    finally:
+        _ffmpeg_semaphore.release()
+
+@contextmanager
+def ffmpeg_slot():
+    """Hold an FFmpeg slot for the duration of the block"""
+    lock_file = acquire_ffmpeg_slot()
+    try:
+        yield
+    finally:
+        release_ffmpeg_slot(lock_file)
+
+def get_codec_args(output_format):
+    """Return explicit encoder settings for the output format"""
+    if output_format == 'mp3':
+        return ['-c:a', 'libmp3lame', '-q:a', '5']  # Fast VBR (~130 kbps)
+    if output_format == 'wav':
+        return ['-c:a', 'pcm_s16le']
+    return []
+
+def feed_ffmpeg_stdin(process, source):
+    """Copy a file-like source into FFmpeg's stdin, then close it to signal EOF"""
+    try:
+        shutil.copyfileobj(source, process.stdin, COPY_BUFFER_SIZE)
+    except (BrokenPipeError, OSError):
+        # FFmpeg exits early on bad input or once the duration cap is hit
+        pass
+    finally:
+        try:
+            process.stdin.close()
+        except OSError:
+            pass
+
+def process_audio_with_ffmpeg(source, output_path, speed, volume, progress_callback=None, duration=None):
+    """Process audio file using FFmpeg with clean remixer effect.
+
+    source is either an input path or a seekable binary file that is fed to
+    FFmpeg's stdin. progress_callback, if given, is called with the fraction
+    of the output written so far whenever FFmpeg reports progress; it needs
+    the input duration, from the duration argument or FFmpeg's own header.
+    Raises AudioTooLongError if the input is longer than MAX_DURATION, even
+    when piped input reports no duration and only the -t cap stops it.
+    """
+    from_path = isinstance(source, str)
+    # FFmpeg writes next to the final name, so a killed job never leaves a
+    # truncated file where a download could pick it up
+    partial_path = output_path + '.part'
+    try:
+        sample_rate = get_sample_rate(source) or DEFAULT_SAMPLE_RATE
+        filter_complex = build_filter_complex(speed, volume, sample_rate)
         
+        # parse_filename() already lowercased the extension
+        output_format = OUTPUT_FORMATS[os.path.splitext(output_path)[1]]
         command = [
-            ffmpeg_path,
-            '-i', input_path,
+            FFMPEG_BIN,
+            '-progress', 'pipe:1',  # Machine-readable key=value blocks on stdout
+            '-hide_banner',
+            '-nostats',
+            '-loglevel', 'info',  # Needed for the input "Duration:" line
+            *FAST_PROBE_ARGS,
+            *FILTER_THREAD_ARGS,
+            '-t', str(MAX_DURATION + 1),  # Never decode far past the limit
+            '-i', source if from_path else 'pipe:0',
             '-filter_complex', filter_complex,
+            '-vn',  # Drop embedded cover art instead of re-encoding it
+            *get_codec_args(output_format),
+            '-threads', str(FFMPEG_THREADS),
+            '-f', output_format,  # Can't be inferred from the .part name
             '-y',
-            '-progress', 'pipe:1',
-            '-loglevel', 'info',
-            '-threads', '2',
-            '-compression_level', '6',
-            output_path
+            partial_path
         ]
         
-        logger.info(f"Running FFmpeg command: {' '.join(command)}")
+        logger.debug("Running FFmpeg command: %s", ' '.join(command))
+        # Output seconds per input second
+        time_scale = 1 / (PITCH_SHIFT * speed)
+
+        with ffmpeg_slot():
+            process = subprocess.Popen(
+                command,
+                stdin=subprocess.DEVNULL if from_path else subprocess.PIPE,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                bufsize=0
+            )
+            if not from_path:
+                threading.Thread(target=feed_ffmpeg_stdin, args=(process, source), daemon=True).start()
+            watchdog = threading.Timer(FFMPEG_TIMEOUT, process.kill)
+            watchdog.daemon = True
+            watchdog.start()
+            memory_sampler = MemorySampler()
+            memory_sampler.start()
+            
+            try:
+                # The input header is printed before decoding starts, so an
+                # over-long upload is rejected without a separate probe.
+                # Only the tail of stderr is kept for error reporting.
+                stderr_lines = deque(maxlen=50)
+                output_duration = duration * time_scale if duration else None
+                output_seconds = 0
+                with selectors.DefaultSelector() as selector:
+                    partial = {}
+                    for pipe in (process.stderr, process.stdout):
+                        selector.register(pipe, selectors.EVENT_READ)
+                        partial[pipe] = b''
+                    while selector.get_map():
+                        for selector_key, _ in selector.select():
+                            pipe = selector_key.fileobj
+                            data = os.read(pipe.fileno(), STREAM_CHUNK_SIZE)
+                            if not data:
+                                selector.unregister(pipe)
+                                continue
+                            *lines, partial[pipe] = (partial[pipe] + data).split(b'\n')
+                            for line in lines:
+                                line = line.decode(errors='replace')
+                                if pipe is process.stdout:
+                                    # out_time_ms is in microseconds despite its name
+                                    name, _, value = line.partition('=')
+                                    if name == 'out_time_ms' and value.isdigit():
+                                        output_seconds = int(value) / 1e6
+                                        if progress_callback is not None and output_duration:
+                                            progress_callback(min(1.0, output_seconds / output_duration))
+                                    continue
+
+                                stderr_lines.append(line)
+                                input_duration = parse_input_duration(line)
+                                if input_duration is not None and input_duration > MAX_DURATION:
+                                    process.kill()
+                                    process.wait()
+                                    cleanup_temp_files(partial_path)
+                                    raise AudioTooLongError('Audio file duration exceeds 12 minutes limit')
+                                if input_duration:
+                                    output_duration = input_duration * time_scale
+                if partial[process.stderr]:
+                    stderr_lines.append(partial[process.stderr].decode(errors='replace'))
+                process.wait()
+            finally:
+                # Don't leave FFmpeg running if reading its output failed
+                if process.poll() is None:
+                    process.kill()
+                    process.wait()
+                watchdog.cancel()
+                memory_sampler.stop()
         
+        if process.returncode != 0:
+            logger.error("FFmpeg error: %s", '\n'.join(stderr_lines))
+            cleanup_temp_files(partial_path)
+            return False
+
+        # Piped input often has no "Duration:" line, and -t then cuts it off
+        # at MAX_DURATION + 1 seconds; never hand out that truncated result
+        if output_seconds > (MAX_DURATION + 0.5) * time_scale:
+            cleanup_temp_files(partial_path)
+            raise AudioTooLongError('Audio file duration exceeds 12 minutes limit')
+
+        os.replace(partial_path, output_path)
+        return True
+        
+    except AudioTooLongError:
+        raise
+    except Exception:
+        logger.exception("Error in process_audio_with_ffmpeg")
+        cleanup_temp_files(partial_path)
+        return False
+
+def stream_audio_with_ffmpeg(source, output_format, speed, volume):
+    """Run FFmpeg with its output piped straight into a response body.
+
+    source is either the path of a saved upload or a file-like object that is
+    fed to FFmpeg's stdin. Returns a TranscodeStream over the processed audio,
+    or None if FFmpeg produced no output (e.g. the input could not be decoded).
+    Raises AudioTooLongError before any output is produced if the input
+    reports a duration over MAX_DURATION.
+    """
+    from_path = isinstance(source, str)
+    sample_rate = (get_sample_rate(source) if from_path else None) or DEFAULT_SAMPLE_RATE
+    command = [
+        FFMPEG_BIN,
+        '-hide_banner',
+        '-nostats',
+        '-loglevel', 'info',  # Needed for the input "Duration:" line
+        *FAST_PROBE_ARGS,
+        *FILTER_THREAD_ARGS,
+        # Piped input rarely reports a duration, so cap what is read instead
+        '-t', str(MAX_DURATION + 1 if from_path else MAX_DURATION),
+        '-i', source if from_path else 'pipe:0',
+        '-filter_complex', build_filter_complex(speed, volume, sample_rate),
+        '-vn',
+        *get_codec_args(output_format),
+        '-threads', str(FFMPEG_THREADS),
+        '-f', output_format,
+        'pipe:1'
+    ]
+
+    logger.debug("Running FFmpeg command: %s", ' '.join(command))
+
+    slot = acquire_ffmpeg_slot()
+    try:
         process = subprocess.Popen(
             command,
+            stdin=subprocess.DEVNULL if from_path else subprocess.PIPE,
             stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            universal_newlines=True
+            stderr=subprocess.PIPE
         )
-        
-        stdout, stderr = process.communicate()
-        
-        if process.returncode != 0:
-            logger.error(f"FFmpeg error: {stderr}")
-            return False
-            
-        logger.info(f"Current memory usage after processing: {check_memory_usage():.2f} MB")
+    except BaseException:
+        release_ffmpeg_slot(slot)
+        raise
+    # Bounds a stuck transcode as well as a raw upload that trickles in
+    watchdog = threading.Timer(FFMPEG_TIMEOUT, process.kill)
+    watchdog.daemon = True
+    watchdog.start()
+    stderr_lines = deque(maxlen=50)
+    header_done = threading.Event()
+    too_long = []
+
+    def drain_stderr():
+        for line in process.stderr:
+            line = line.decode(errors='replace')
+            stderr_lines.append(line)
+            duration = parse_input_duration(line)
+            if duration is not None and duration > MAX_DURATION:
+                too_long.append(True)
+            if line.startswith('Stream mapping:'):
+                header_done.set()
+        header_done.set()
+
+    def finish():
+        # Reap FFmpeg and give its slot back
+        if process.poll() is None:
+            process.kill()
+        process.wait()
+        watchdog.cancel()
+        stderr_reader.join()
+        release_ffmpeg_slot(slot)
+        if process.returncode not in (0, -9):
+            logger.error("FFmpeg error: %s", ''.join(stderr_lines))
+
+    stderr_reader = threading.Thread(target=drain_stderr, daemon=True)
+    if not from_path:
+        threading.Thread(target=feed_ffmpeg_stdin, args=(process, source), daemon=True).start()
+    stderr_reader.start()
+
+    # FFmpeg prints the input header before any output, so an over-long
+    # upload is rejected while an error status can still be returned
+    if not header_done.wait(HEADER_TIMEOUT):
+        finish()
+        logger.warning("FFmpeg read no input header within %s seconds", HEADER_TIMEOUT)
+        return None
+    if too_long:
+        finish()
+        raise AudioTooLongError('Audio file duration exceeds 12 minutes limit')
+
+    stream = TranscodeStream(process, finish)
+    # Wait for the first output so a failed decode can still be reported
+    if not stream.wait_for_output():
+        stream.close()
+        return None
+    return stream
+
+class TranscodeStream:
+    """FFmpeg's stdout relayed to a response body through an unlinked spool file.
+
+    A pump thread drains FFmpeg into the spool as fast as it produces output,
+    so the transcode and its slot are done however slowly the client reads.
+    close() stops FFmpeg if it is still running and must always be called;
+    audio_response() registers it with Response.call_on_close.
+    """
+
+    def __init__(self, process, finish):
+        self._process = process
+        self._finish = finish
+        self._spool = tempfile.TemporaryFile(dir=TEMP_DIR)
+        self._written = 0
+        self._done = False
+        self._changed = threading.Condition()
+        self._pump = threading.Thread(target=self._run_pump, daemon=True)
+        self._pump.start()
+
+    def _run_pump(self):
+        try:
+            while True:
+                chunk = self._process.stdout.read1(STREAM_CHUNK_SIZE)
+                if not chunk:
+                    break
+                with self._changed:
+                    self._spool.seek(0, io.SEEK_END)
+                    self._spool.write(chunk)
+                    self._written += len(chunk)
+                    self._changed.notify_all()
+        finally:
+            self._finish()
+            with self._changed:
+                self._done = True
+                self._changed.notify_all()
+
+    def wait_for_output(self):
+        """Block until FFmpeg has produced output or exited; True if there is output"""
+        with self._changed:
+            self._changed.wait_for(lambda: self._written or self._done)
+            return self._written > 0
+
+    def __iter__(self):
+        offset = 0
+        while True:
+            with self._changed:
+                self._changed.wait_for(lambda: self._written > offset or self._done)
+                if self._written == offset:
+                    return
+                self._spool.seek(offset)
+                chunk = self._spool.read(min(self._written - offset, STREAM_CHUNK_SIZE))
+            offset += len(chunk)
+            yield chunk
+
+    def close(self):
+        """Stop FFmpeg if the client went away early, then drop the spool"""
+        if self._process.poll() is None:
+            self._process.kill()
+        self._pump.join()
+        self._spool.close()
+
+def audio_response(audio, output_format, filename):
+    """Wrap a TranscodeStream in an attachment response that always closes it"""
+    response = Response(
+        audio,
+        mimetype=MIMETYPES[output_format],
+        headers={'Content-Disposition': f'attachment; filename={filename}'}
+    )
+    # Unlike a generator's finally, this runs even if the body never started
+    response.call_on_close(audio.close)
+    return response
+
+def retag_wav_sample_rate(input_path, output_path, speed):
+    """Speed up a WAV file by rewriting the sample rate in its fmt chunk.
+
+    Pitch changes along with tempo, but no samples are decoded, re-encoded or
+    even copied: the upload is patched in place and renamed to output_path.
+    Returns False, leaving the upload untouched, if it is not a WAV file we
+    can patch.
+    """
+    try:
+        patched = False
+        with open(input_path, 'r+b') as f, mmap.mmap(f.fileno(), 0) as m:
+            fmt = _find_wav_chunk(m, b'fmt ')
+            if fmt is not None and fmt[1] >= 16:
+                offset = fmt[0]
+                sample_rate = struct.unpack_from('<I', m, offset + 4)[0]
+                block_align = struct.unpack_from('<H', m, offset + 12)[0]
+                new_rate = int(round(sample_rate * speed))
+                struct.pack_into('<I', m, offset + 4, new_rate)
+                struct.pack_into('<I', m, offset + 8, new_rate * block_align)
+                patched = True
+
+        if patched:
+            os.replace(input_path, output_path)
+        return patched
+    except Exception:
+        logger.exception("Error retagging WAV sample rate")
+        return False
+
+class PrefixedStream(io.RawIOBase):
+    """Read-only stream that replays bytes already read from a stream, then the rest of it"""
+
+    def __init__(self, prefix, stream):
+        self._prefix = memoryview(prefix)
+        self._stream = stream
+
+    def readable(self):
         return True
-        
-    except Exception as e:
-        logger.error(f"Error in process_audio_with_ffmpeg: {str(e)}")
+
+    def readinto(self, buffer):
+        if self._prefix:
+            n = min(len(buffer), len(self._prefix))
+            buffer[:n] = self._prefix[:n]
+            self._prefix = self._prefix[n:]
+            return n
+        data = self._stream.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+class RedisBlobReader(io.RawIOBase):
+    """Seekable read-only file over a Redis string, fetched with GETRANGE"""
+
+    def __init__(self, connection, key):
+        self._connection = connection
+        self._key = key
+        self._size = connection.strlen(key)
+        self._pos = 0
+
+    def __len__(self):
+        return self._size
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._pos
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self._pos
+        elif whence == io.SEEK_END:
+            offset += self._size
+        self._pos = max(0, offset)
+        return self._pos
+
+    def readinto(self, buffer):
+        # An empty range would be end=-1, which GETRANGE reads as the last byte
+        if self._pos >= self._size or not len(buffer):
+            return 0
+        end = min(self._pos + len(buffer), self._size) - 1  # GETRANGE is inclusive
+        data = self._connection.getrange(self._key, self._pos, end)
+        buffer[:len(data)] = data
+        self._pos += len(data)
+        return len(data)
+
+def store_upload(input_path, input_key):
+    """Copy a saved upload into Redis in COPY_BUFFER_SIZE pieces.
+
+    Returns False without storing it if the uploads already waiting in Redis
+    would then exceed MAX_QUEUED_BYTES.
+    """
+    # Register the upload before checking the total, so concurrent uploads
+    # count each other and can't both squeeze in under the limit
+    with redis_conn.pipeline() as pipe:
+        pipe.zadd(QUEUED_UPLOADS_KEY, {input_key: time.time() + INPUT_TTL})
+        pipe.hset(QUEUED_SIZES_KEY, input_key, os.path.getsize(input_path))
+        pipe.execute()
+    if queued_upload_bytes(redis_conn) > MAX_QUEUED_BYTES:
+        release_upload(redis_conn, input_key)
         return False
-    finally:
-        gc.collect()
 
-def process_audio_job(input_path, output_path, speed, volume):
-    """Background job for processing audio"""
     try:
-        success = process_audio_with_ffmpeg(input_path, output_path, speed, volume)
+        with open(input_path, 'rb') as f:
+            redis_conn.set(input_key, f.read(COPY_BUFFER_SIZE), ex=INPUT_TTL)
+            for chunk in iter(lambda: f.read(COPY_BUFFER_SIZE), b''):
+                redis_conn.append(input_key, chunk)
+    except Exception:
+        release_upload(redis_conn, input_key)
+        raise
+    return True
+
+def queued_upload_bytes(connection):
+    """Total size of the uploads waiting in Redis.
+
+    Entries are dropped once their upload's INPUT_TTL has passed, so an upload
+    whose job was lost, killed or never enqueued stops counting when Redis
+    expires it, instead of holding part of the budget forever.
+    """
+    expired = connection.zrangebyscore(QUEUED_UPLOADS_KEY, '-inf', time.time())
+    if expired:
+        with connection.pipeline() as pipe:
+            pipe.zrem(QUEUED_UPLOADS_KEY, *expired)
+            pipe.hdel(QUEUED_SIZES_KEY, *expired)
+            pipe.execute()
+    return sum(int(size) for size in connection.hvals(QUEUED_SIZES_KEY))
+
+def release_upload(connection, input_key):
+    """Delete an upload stored by store_upload and drop it from the MAX_QUEUED_BYTES budget"""
+    with connection.pipeline() as pipe:
+        pipe.delete(input_key)
+        pipe.zrem(QUEUED_UPLOADS_KEY, input_key)
+        pipe.hdel(QUEUED_SIZES_KEY, input_key)
+        pipe.execute()
+
+def process_audio_job(input_key, output_path, speed, volume, duration=None):
+    """Background job for processing an upload stored in Redis under input_key.
+
+    duration is the input length measured by the web tier, if known; piped
+    input rarely reports one, and progress can't be computed without it.
+    """
+    job = get_current_job()
+    try:
+        upload = RedisBlobReader(job.connection, input_key)
+        if not len(upload):
+            return {'status': 'failed', 'error': 'Upload expired before processing'}
+
+        last_saved = float('-inf')
+
+        def save_progress(fraction):
+            # /status reads job.meta; save it at most once a second
+            nonlocal last_saved
+            now = time.monotonic()
+            if now - last_saved >= 1:
+                job.meta['progress'] = int(fraction * 100)
+                job.save_meta()
+                last_saved = now
+
+        # The upload goes from Redis into FFmpeg's stdin a chunk at a time, so
+        # workers neither hold it in memory nor need the web temp dir
+        success = process_audio_with_ffmpeg(upload, output_path, speed, volume, save_progress, duration)
         if success:
+            job.meta['progress'] = 100
+            job.save_meta()
+            # Downloads look the path up directly instead of loading the job
+            job.connection.setex(f"out:{job.id}", RESULT_TTL, output_path)
             return {'status': 'completed', 'output_path': output_path}
         return {'status': 'failed', 'error': 'Processing failed'}
+    except AudioTooLongError as e:
+        return {'status': 'failed', 'error': str(e)}
     except Exception as e:
-        logger.error(f"Error in process_audio_job: {str(e)}")
+        logger.exception("Error in process_audio_job")
         return {'status': 'failed', 'error': str(e)}
+    finally:
+        release_upload(job.connection, input_key)
+
+def parse_filename(filename):
+    """Split an upload filename into a filesystem-safe name and its lowercase extension"""
+    name, ext = os.path.splitext(filename)
+    ext = ext.lower()
+    return _UNSAFE_FILENAME_CHARS.sub('_', name)[:64] + ext, ext
+
+def validate_parameters(speed, volume):
+    """Return an error message if speed or volume is out of range, else None"""
+    if not (0.5 <= speed <= 2.0):
+        return 'Speed must be between 0.5 and 2.0'
+    if not (0.0 <= volume <= 2.0):
+        return 'Volume must be between 0.0 and 2.0'
+    return None
+
+def start_processing(input_path, output_path, speed, volume, fast=False):
+    """Check the saved upload and either queue it or process it synchronously"""
+    if fast and input_path.endswith('.wav'):
+        # Fast mode: pitch follows speed, only the WAV header is rewritten
+        if retag_wav_sample_rate(input_path, output_path, speed):
+            return jsonify({
+                'status': 'completed',
+                'message': 'Audio processed successfully',
+                'queue_enabled': False,
+                'download_url': f'/download/direct/{os.path.basename(output_path)}'
+            })
+        # Not a WAV file we can patch, fall back to the full FFmpeg pipeline
+
+    # Read from the headers so an over-long upload is refused before it is
+    # queued; FFmpeg still enforces the limit for files it can't be read from
+    duration = get_audio_duration(input_path)
+    if duration is not None and duration > MAX_DURATION:
+        cleanup_temp_files(input_path)
+        return jsonify({'error': 'Audio file duration exceeds 12 minutes limit'}), 400
+
+    if USE_REDIS:
+        # Hand the upload to the worker through Redis instead of the temp dir
+        input_key = f"in:{os.path.basename(input_path)}"
+        stored = store_upload(input_path, input_key)
+        cleanup_temp_files(input_path)
+        if not stored:
+            return jsonify({'error': 'Too many uploads waiting to be processed, try again later'}), 503
+
+        # Queue the processing job
+        try:
+            job = queue.enqueue(
+                process_audio_job,
+                args=(input_key, output_path, speed, volume, duration),
+                job_timeout='10m',  # 10 minutes timeout
+                result_ttl=RESULT_TTL  # Failures are returned as results too
+            )
+        except Exception:
+            release_upload(redis_conn, input_key)
+            raise
+
+        return jsonify({
+            'status': 'processing',
+            'job_id': job.id,
+            'message': 'Audio processing started',
+            'queue_enabled': True
+        }), 202
+
+    # Process synchronously if Redis is not available, streaming FFmpeg's
+    # output into the response instead of writing output_path to disk
+    output_format = OUTPUT_FORMATS[os.path.splitext(input_path)[1]]
+    try:
+        audio = stream_audio_with_ffmpeg(input_path, output_format, speed, volume)
+    except AudioTooLongError as e:
+        cleanup_temp_files(input_path)
+        return jsonify({'error': str(e)}), 400
+    if audio is None:
+        cleanup_temp_files(input_path)
+        return jsonify({'error': 'Failed to process audio'}), 500
+
+    response = audio_response(audio, output_format, os.path.basename(output_path))
+    response.call_on_close(lambda: cleanup_temp_files(input_path))
+    return response
+
+def send_output_file(output_path):
+    """Send a processed file; the janitor removes it once RESULT_TTL has passed"""
+    filename = os.path.basename(output_path)
+    output_format = OUTPUT_FORMATS.get(os.path.splitext(filename)[1].lower())
+    mimetype = MIMETYPES.get(output_format, 'application/octet-stream')
+    headers = {'Content-Disposition': f'attachment; filename={filename}'}
+
+    # A front proxy that advertises sendfile support (Rack::Sendfile convention)
+    # serves the file itself, so Python never reads it
+    sendfile_type = request.headers.get('X-Sendfile-Type')
+    if sendfile_type in ('X-Accel-Redirect', 'X-Sendfile'):
+        if sendfile_type == 'X-Accel-Redirect':
+            headers['X-Accel-Redirect'] = ACCEL_REDIRECT_PREFIX + filename
+        else:
+            headers['X-Sendfile'] = output_path
+        response = Response(mimetype=mimetype, headers=headers)
+    else:
+        # send_file hands the open file to wsgi.file_wrapper, which gunicorn
+        # serves with sendfile(2) instead of a Python read/yield loop.
+        # conditional=True answers Range requests with 206 and advertises
+        # Accept-Ranges: bytes.
+        response = send_file(
+            output_path,
+            mimetype=mimetype,
+            as_attachment=True,
+            download_name=filename,
+            conditional=True
+        )
+
+    return response
+
+def start_janitor():
+    """Sweep TEMP_DIR from a daemon thread of this process.
+
+    Called by gunicorn's post_worker_init hook and the development server,
+    not on import, so RQ workers and scripts that import the app don't run
+    one. Every web process runs it; the flock keeps sweeps from overlapping.
+    """
+    threading.Thread(target=run_janitor, daemon=True).start()
 
 @app.route('/')
 def index():
@@ -204,13 +1100,17 @@ def index():
 
 @app.route('/process-audio', methods=['POST'])
 def process_audio():
+    if request.mimetype != 'multipart/form-data':
+        # Raw audio bodies skip the multipart parser entirely
+        return process_raw()
+
     input_path = None
     output_path = None
     try:
-        if 'file' not in request.files:
+        file = request.files.get('file')
+        if file is None:
             return jsonify({'error': 'No file provided'}), 400
 
-        file = request.files['file']
         if file.filename == '':
             return jsonify({'error': 'No file selected'}), 400
 
@@ -218,58 +1118,99 @@ def process_audio():
         speed = float(request.form.get('speed', 1.15))
         volume = float(request.form.get('volume', 1.0))
 
-        # Validate parameters
-        if not (0.5 <= speed <= 2.0):
-            return jsonify({'error': 'Speed must be between 0.5 and 2.0'}), 400
-        if not (0.0 <= volume <= 2.0):
-            return jsonify({'error': 'Volume must be between 0.0 and 2.0'}), 400
+        error = validate_parameters(speed, volume)
+        if error:
+            return jsonify({'error': error}), 400
+
+        filename, ext = parse_filename(file.filename)
+        if ext not in ALLOWED_EXTENSIONS:
+            return jsonify({'error': 'Only MP3 and WAV files are supported'}), 400
 
         # Generate unique filenames
-        filename = secure_filename(file.filename)
-        job_id = str(uuid.uuid4())
+        job_id = secrets.token_hex(8)
         input_path = os.path.join(app.config['UPLOAD_FOLDER'], f"input_{job_id}_{filename}")
         output_path = os.path.join(app.config['UPLOAD_FOLDER'], f"output_{job_id}_{filename}")
 
-        # Save uploaded file
-        file.save(input_path)
+        # The upload is already spooled in TEMP_DIR, so give it its final
+        # name with a hard link; the spool file is removed when it is closed
+        file.stream.flush()
+        os.link(file.stream.name, input_path)
+
+        fast = request.form.get('mode') == 'fast'
+        return start_processing(input_path, output_path, speed, volume, fast)
 
-        # Check audio duration
-        duration = get_audio_duration(input_path)
-        if duration is not None and duration > 12 * 60:  # 12 minutes in seconds
+    except Exception as e:
+        logger.exception("Error in process_audio")
+        if input_path:
             cleanup_temp_files(input_path)
-            return jsonify({'error': 'Audio file duration exceeds 12 minutes limit'}), 400
+        if output_path and os.path.exists(output_path):
+            cleanup_temp_files(output_path)
+        return jsonify({'error': str(e)}), 500
 
-        if USE_REDIS:
-            # Queue the processing job
-            job = queue.enqueue(
-                process_audio_job,
-                args=(input_path, output_path, speed, volume),
-                job_timeout='10m',  # 10 minutes timeout
-                result_ttl=300  # Keep result for 5 minutes
-            )
+@app.route('/process-raw', methods=['POST'])
+def process_raw():
+    """Process a raw audio request body without multipart form parsing"""
+    input_path = None
+    output_path = None
+    try:
+        filename = request.headers.get('X-Filename') or request.args.get('filename', '')
+        if not filename:
+            return jsonify({'error': 'No filename provided'}), 400
 
-            return jsonify({
-                'status': 'processing',
-                'job_id': job.id,
-                'message': 'Audio processing started',
-                'queue_enabled': True
-            }), 202
-        else:
-            # Process synchronously if Redis is not available
-            success = process_audio_with_ffmpeg(input_path, output_path, speed, volume)
-            if not success:
-                cleanup_temp_files(input_path, output_path)
-                return jsonify({'error': 'Failed to process audio'}), 500
+        filename, ext = parse_filename(filename)
+        if ext not in ALLOWED_EXTENSIONS:
+            return jsonify({'error': 'Only MP3 and WAV files are supported'}), 400
 
-            return jsonify({
-                'status': 'completed',
-                'message': 'Audio processed successfully',
-                'queue_enabled': False,
-                'download_url': f'/download/direct/{os.path.basename(output_path)}'
-            })
+        speed = float(request.args.get('speed', 1.15))
+        volume = float(request.args.get('volume', 1.0))
+
+        error = validate_parameters(speed, volume)
+        if error:
+            return jsonify({'error': error}), 400
+
+        # Werkzeug only enforces MAX_CONTENT_LENGTH in the form parser, so
+        # check raw bodies here and never read past the declared length
+        content_length = request.content_length
+        if content_length is None or content_length > app.config['MAX_CONTENT_LENGTH']:
+            return jsonify({'error': 'File too large or missing Content-Length (max 100MB)'}), 413
+        body = LimitedStream(request.stream, content_length)
+
+        fast = request.args.get('mode') == 'fast'
+        head = b''
+        if not USE_REDIS and not (fast and ext == '.wav'):
+            # Piped input rarely reports a duration and would be cut off at
+            # -t, so measure it from its headers and Content-Length first
+            head = body.read(HEADER_PEEK_SIZE)
+            duration = read_audio_duration(io.BytesIO(head), content_length, ext == '.wav')
+            if duration is not None and duration > MAX_DURATION:
+                return jsonify({'error': 'Audio file duration exceeds 12 minutes limit'}), 400
+
+            if duration is not None:
+                # Without a queue, pipe the body straight through FFmpeg
+                output_format = OUTPUT_FORMATS[ext]
+                try:
+                    audio = stream_audio_with_ffmpeg(PrefixedStream(head, body), output_format, speed, volume)
+                except AudioTooLongError as e:
+                    return jsonify({'error': str(e)}), 400
+                if audio is None:
+                    return jsonify({'error': 'Failed to process audio'}), 500
+
+                return audio_response(audio, output_format, filename)
+            # Otherwise save it first, so FFmpeg can measure the file itself
+
+        job_id = secrets.token_hex(8)
+        input_path = os.path.join(app.config['UPLOAD_FOLDER'], f"input_{job_id}_{filename}")
+        output_path = os.path.join(app.config['UPLOAD_FOLDER'], f"output_{job_id}_{filename}")
+
+        # Copy the body to disk in COPY_BUFFER_SIZE chunks as it arrives
+        with open(input_path, 'wb') as f:
+            f.write(head)
+            shutil.copyfileobj(body, f, COPY_BUFFER_SIZE)
+
+        return start_processing(input_path, output_path, speed, volume, fast)
 
     except Exception as e:
-        logger.error(f"Error in process_audio: {str(e)}")
+        logger.exception("Error in process_raw")
         if input_path:
             cleanup_temp_files(input_path)
         if output_path and os.path.exists(output_path):
@@ -279,6 +1220,9 @@ def process_audio():
 @app.route('/status/<job_id>', methods=['GET'])
 def get_status(job_id):
     """Check the status of a processing job"""
+    if not USE_REDIS:
+        return jsonify({'status': 'not_found'}), 404
+
     try:
         job = queue.fetch_job(job_id)
         if job is None:
@@ -299,53 +1243,37 @@ def get_status(job_id):
                 })
             return jsonify({'status': 'failed', 'error': result.get('error', 'Unknown error')})
 
-        # Job is still processing
+        # Job is still queued or running
         return jsonify({
             'status': 'processing',
+            'state': job.get_status(),
             'position': job.get_position(),
             'progress': job.meta.get('progress', 0)
         })
 
     except Exception as e:
-        logger.error(f"Error checking job status: {str(e)}")
+        logger.exception("Error checking job status")
         return jsonify({'error': str(e)}), 500
 
 @app.route('/download/<job_id>', methods=['GET'])
 def download_file(job_id):
     """Download the processed file"""
+    if not USE_REDIS:
+        return jsonify({'error': 'File not found'}), 404
+
     try:
-        job = queue.fetch_job(job_id)
-        if job is None or not job.is_finished:
+        output_path = redis_conn.get(f"out:{job_id}")
+        if output_path is None:
             return jsonify({'error': 'File not found'}), 404
 
-        result = job.result
-        if result['status'] != 'completed':
-            return jsonify({'error': 'Processing failed'}), 500
-
-        output_path = result['output_path']
+        output_path = output_path.decode()
         if not os.path.exists(output_path):
             return jsonify({'error': 'File not found'}), 404
 
-        def generate():
-            try:
-                with open(output_path, 'rb') as f:
-                    while True:
-                        chunk = f.read(8192)
-                        if not chunk:
-                            break
-                        yield chunk
-            finally:
-                cleanup_temp_files(output_path)
-
-        filename = os.path.basename(output_path)
-        return Response(
-            generate(),
-            mimetype='audio/mpeg',
-            headers={'Content-Disposition': f'attachment; filename={filename}'}
-        )
+        return send_output_file(output_path)
 
     except Exception as e:
-        logger.error(f"Error downloading file: {str(e)}")
+        logger.exception("Error downloading file")
         return jsonify({'error': str(e)}), 500
 
 @app.route('/download/direct/<filename>')
@@ -356,26 +1284,13 @@ def download_direct(filename):
         if not os.path.exists(output_path):
             return jsonify({'error': 'File not found'}), 404
 
-        def generate():
-            try:
-                with open(output_path, 'rb') as f:
-                    while True:
-                        chunk = f.read(8192)
-                        if not chunk:
-                            break
-                        yield chunk
-            finally:
-                cleanup_temp_files(output_path)
-
-        return Response(
-            generate(),
-            mimetype='audio/mpeg',
-            headers={'Content-Disposition': f'attachment; filename={filename}'}
-        )
+        return send_output_file(output_path)
 
     except Exception as e:
-        logger.error(f"Error downloading file: {str(e)}")
+        logger.exception("Error downloading file")
         return jsonify({'error': str(e)}), 500
 
 if __name__ == '__main__':
-    app.run(debug=True)
+    # Development server only; production runs under gunicorn (see gunicorn_config.py)
+    start_janitor()
+    app.run(debug=bool(os.environ.get('FLASK_DEV')))
@@ -1,17 +1,30 @@
-import multiprocessing
+import os
 
 # Gunicorn configuration for Railway deployment
 
 # Worker settings
-workers = multiprocessing.cpu_count() * 2 + 1
-worker_class = 'sync'  # Using sync workers for file processing
-timeout = 300  # 5 minutes timeout
+# The web processes only move bytes between clients, disk and FFmpeg, so a
+# couple of processes with many threads each serve concurrent uploads and
+# downloads without a full copy of the app per request. Concurrent
+# transcodes are capped separately by FFMPEG_SLOTS.
+workers = int(os.environ.get('WORKERS', 2))
+worker_class = os.environ.get('WORKER_CLASS', 'gthread')
+threads = int(os.environ.get('THREADS', 16))
+worker_connections = 1000
+timeout = int(os.environ.get('TIMEOUT', 300))  # 5 minutes timeout
 keepalive = 65
 
 # Server settings
-bind = "0.0.0.0:$PORT"  # Railway provides PORT environment variable
+bind = f"0.0.0.0:{os.environ.get('PORT', '8080')}"  # Railway provides PORT environment variable
 worker_tmp_dir = "/dev/shm"  # Use shared memory for temporary files
-preload_app = True
+# Each worker imports the app itself, so the Redis connection and FFmpeg slot
+# state are created per process instead of being inherited across fork()
+preload_app = False
+
+def post_worker_init(worker):
+    # Each worker sweeps the temp dir; importing the app doesn't start it
+    from app import start_janitor
+    start_janitor()
 
 # Logging
 accesslog = "-"  # Log to stdout
@@ -4,6 +4,8 @@ import pydub
 from pydub import AudioSegment
 import os
 import shutil
+import wave
+from concurrent.futures import ThreadPoolExecutor
 
 class Mp3SpeedChanger:
     def __init__(self, root):
@@ -17,15 +19,15 @@ class Mp3SpeedChanger:
         AudioSegment.converter = r"C:\Program Files\ffmpeg\bin\ffmpeg.exe"
         AudioSegment.ffprobe = r"C:\Program Files\ffmpeg\bin\ffprobe.exe"
 
-        # Create a label and button to select an MP3 file
-        self.label = tk.Label(root, text="Select an MP3 file:", font=("Arial", 12))
+        # Create a label and button to select an MP3 or WAV file
+        self.label = tk.Label(root, text="Select an MP3 or WAV file:", font=("Arial", 12))
         self.label.pack(pady=10)
 
         self.button = tk.Button(root, text="Browse", command=self.select_file, font=("Arial", 12), width=10)
         self.button.pack(pady=10)
 
-        # Create a label and button to download the sped-up and slowed-down MP3 files
-        self.download_label = tk.Label(root, text="Download sped-up and slowed-down MP3 files:", font=("Arial", 12))
+        # Create a label and button to download the sped-up and slowed-down files
+        self.download_label = tk.Label(root, text="Download sped-up and slowed-down files:", font=("Arial", 12))
         self.download_label.pack(pady=10)
 
         self.download_button = tk.Button(root, text="Download", command=self.download_files, state=tk.DISABLED, font=("Arial", 12), width=10)
@@ -41,21 +43,45 @@ class Mp3SpeedChanger:
         self.slowed_down_audio = None
 
     def select_file(self):
-        self.file_path = filedialog.askopenfilename(filetypes=[("MP3 files", "*.mp3")])
+        self.file_path = filedialog.askopenfilename(filetypes=[("Audio files", "*.mp3 *.wav")])
         if self.file_path:
             self.button.config(text="File selected!")
-            self.speed_up_mp3()
-            self.slow_down_mp3()
+            if not self.is_wav():
+                # Decode once and derive both versions from the same samples.
+                # Naming the codec stops pydub from running ffprobe on the file first.
+                audio = pydub.AudioSegment.from_file(self.file_path, format="mp3", codec="mp3")
+                self.speed_up_mp3(audio)
+                self.slow_down_mp3(audio)
             self.download_button.config(state=tk.NORMAL)
 
-    def speed_up_mp3(self):
-        audio = pydub.AudioSegment.from_mp3(self.file_path)
+    def is_wav(self):
+        return self.file_path.lower().endswith(".wav")
+
+    def speed_up_mp3(self, audio):
         self.sped_up_audio = audio._spawn(audio.raw_data, overrides={"frame_rate": int(audio.frame_rate * 1.15)})
 
-    def slow_down_mp3(self):
-        audio = pydub.AudioSegment.from_mp3(self.file_path)
+    def slow_down_mp3(self, audio):
         self.slowed_down_audio = audio._spawn(audio.raw_data, overrides={"frame_rate": int(audio.frame_rate * 0.85)})
 
+    def export_wav(self, new_file_path, rate_factor):
+        # WAV needs no decode or encode: copy the PCM frames under a new frame rate
+        try:
+            with wave.open(self.file_path, "rb") as src, wave.open(new_file_path, "wb") as dst:
+                dst.setnchannels(src.getnchannels())
+                dst.setsampwidth(src.getsampwidth())
+                dst.setframerate(int(src.getframerate() * rate_factor))
+                while True:
+                    frames = src.readframes(65536)
+                    if not frames:
+                        break
+                    dst.writeframes(frames)
+        except (wave.Error, EOFError):
+            # The wave module only reads plain PCM; let ffmpeg decode float or
+            # extensible WAVs instead
+            audio = AudioSegment.from_file(self.file_path, format="wav")
+            audio = audio._spawn(audio.raw_data, overrides={"frame_rate": int(audio.frame_rate * rate_factor)})
+            audio.export(new_file_path, format="wav").close()
+
     def download_files(self):
         file_path, file_name = self.file_path.rsplit("/", 1)
         folder_name = f"Modified {file_name.rsplit('.', 1)[0]}"
@@ -70,8 +96,18 @@ class Mp3SpeedChanger:
         new_file_path_spd = f"{folder_path}/{new_file_name_spd}"
         new_file_path_slow = f"{folder_path}/{new_file_name_slow}"
 
-        self.sped_up_audio.export(new_file_path_spd, format="mp3")
-        self.slowed_down_audio.export(new_file_path_slow, format="mp3")
+        if self.is_wav():
+            self.export_wav(new_file_path_spd, 1.15)
+            self.export_wav(new_file_path_slow, 0.85)
+        else:
+            # Each export runs its own ffmpeg encode, so run both at once
+            with ThreadPoolExecutor(max_workers=2) as executor:
+                exports = [
+                    executor.submit(self.sped_up_audio.export, new_file_path_spd, format="mp3"),
+                    executor.submit(self.slowed_down_audio.export, new_file_path_slow, format="mp3"),
+                ]
+                for export in exports:
+                    export.result().close()
 
         self.progress_bar.stop()
         self.progress_bar.config(mode="determinate")
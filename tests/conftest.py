@@ -0,0 +1,10 @@
+import os
+import sys
+import tempfile
+
+# app reads these at import time: keep temp files out of /app/temp and use
+# the synchronous path instead of connecting to Redis
+os.environ['TEMP_DIR'] = tempfile.mkdtemp(prefix='songstretcher-test-')
+os.environ.pop('REDIS_URL', None)
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,666 @@
+import io
+import math
+import os
+import struct
+import sys
+import time
+import wave
+
+import pytest
+
+import app
+
+
+@pytest.mark.parametrize('speed, stages', [
+    (1.15, ['atempo=1.15']),
+    (2.0, ['atempo=2.0']),
+    (0.5, ['atempo=0.5']),
+    (3.0, ['atempo=2.0', 'atempo=1.5']),
+    (5.0, ['atempo=2.0', 'atempo=2.0', 'atempo=1.25']),
+    (0.3, ['atempo=0.5', 'atempo=0.6']),
+])
+def test_build_atempo_filter_splits_out_of_range_factors(speed, stages):
+    assert app.build_atempo_filter(speed).split(',') == stages
+
+
+@pytest.mark.parametrize('speed', [0.1, 0.25, 0.7, 1.0, 4.5, 10.0])
+def test_build_atempo_filter_stages_multiply_to_speed(speed):
+    factors = [float(stage.split('=')[1]) for stage in app.build_atempo_filter(speed).split(',')]
+    assert all(0.5 <= factor <= 2.0 for factor in factors)
+    assert math.isclose(math.prod(factors), speed)
+
+
+def write_wav(path, frames=b'\x01\x02' * 2000, rate=44100, channels=2):
+    with wave.open(str(path), 'wb') as w:
+        w.setnchannels(channels)
+        w.setsampwidth(2)
+        w.setframerate(rate)
+        w.writeframes(frames)
+
+
+def test_retag_wav_sample_rate_rewrites_rate_and_byte_rate(tmp_path):
+    input_path, output_path = tmp_path / 'in.wav', tmp_path / 'out.wav'
+    write_wav(input_path)
+    original = input_path.read_bytes()
+
+    assert app.retag_wav_sample_rate(str(input_path), str(output_path), 1.5)
+
+    assert not input_path.exists()
+    with wave.open(str(output_path), 'rb') as w:
+        assert w.getframerate() == 66150
+        assert w.readframes(w.getnframes()) == b'\x01\x02' * 2000
+    patched = output_path.read_bytes()
+    # Byte rate follows the new sample rate; nothing else changes
+    assert int.from_bytes(patched[28:32], 'little') == 66150 * 4
+    assert patched[:24] == original[:24] and patched[32:] == original[32:]
+
+
+def test_retag_wav_sample_rate_finds_fmt_after_other_chunks(tmp_path):
+    input_path, output_path = tmp_path / 'in.wav', tmp_path / 'out.wav'
+    write_wav(input_path, rate=48000, channels=1)
+    data = input_path.read_bytes()
+    # Insert an odd-sized LIST chunk (padded to even) before "fmt "
+    extra = b'LIST' + (3).to_bytes(4, 'little') + b'abc\x00'
+    data = data[:4] + (len(data) - 8 + len(extra)).to_bytes(4, 'little') + data[8:12] + extra + data[12:]
+    input_path.write_bytes(data)
+
+    assert app.retag_wav_sample_rate(str(input_path), str(output_path), 0.5)
+
+    with wave.open(str(output_path), 'rb') as w:
+        assert w.getframerate() == 24000
+
+
+def riff_wav(format_tag, rate, channels=2, bits=32, data=bytes(800), data_size=None, extra_chunks=b''):
+    """Build a WAV by hand, for formats the wave module can't write"""
+    block_align = channels * bits // 8
+    fmt = struct.pack('<HHIIHH', format_tag, channels, rate, rate * block_align, block_align, bits)
+    if format_tag == 0xFFFE:
+        # WAVE_FORMAT_EXTENSIBLE: cbSize, valid bits, channel mask, subformat GUID
+        fmt += struct.pack('<HHI', 22, bits, 0x3) + b'\x01\x00' + bytes(14)
+    body = (b'WAVE' + extra_chunks + b'fmt ' + struct.pack('<I', len(fmt)) + fmt
+            + b'data' + struct.pack('<I', len(data) if data_size is None else data_size) + data)
+    return b'RIFF' + struct.pack('<I', len(body)) + body
+
+
+@pytest.mark.parametrize('format_tag, bits', [(1, 16), (3, 32), (0xFFFE, 24)])
+def test_get_sample_rate_reads_any_wav_format(tmp_path, format_tag, bits):
+    path = tmp_path / 'song.wav'
+    path.write_bytes(riff_wav(format_tag, 48000, bits=bits, extra_chunks=b'LIST\x04\x00\x00\x00info'))
+
+    assert app.get_sample_rate(str(path)) == 48000
+    with open(path, 'rb') as f:
+        assert app.get_sample_rate(f) == 48000
+        assert f.tell() == 0
+
+
+def test_retag_wav_sample_rate_leaves_non_wav_untouched(tmp_path):
+    input_path, output_path = tmp_path / 'in.wav', tmp_path / 'out.wav'
+    input_path.write_bytes(b'ID3' + bytes(100))
+
+    assert not app.retag_wav_sample_rate(str(input_path), str(output_path), 1.5)
+
+    assert input_path.read_bytes() == b'ID3' + bytes(100)
+    assert not output_path.exists()
+
+
+@pytest.mark.parametrize('filename, expected', [
+    ('song.mp3', ('song.mp3', '.mp3')),
+    ('Song.WAV', ('Song.wav', '.wav')),
+    ('My Song (remix) #2.mp3', ('My_Song_remix_2.mp3', '.mp3')),
+    ('../../etc/passwd.wav', ('.._.._etc_passwd.wav', '.wav')),
+    ('chanson été.mp3', ('chanson_t_.mp3', '.mp3')),
+    ('noextension', ('noextension', '')),
+])
+def test_parse_filename(filename, expected):
+    assert app.parse_filename(filename) == expected
+
+
+def test_parse_filename_caps_name_length_and_keeps_extension():
+    name, ext = app.parse_filename('a' * 300 + '.MP3')
+    assert name == 'a' * 64 + '.mp3'
+    assert ext == '.mp3'
+
+
+def test_unsafe_filename_chars_strip_path_separators():
+    assert '/' not in app.parse_filename('a/b\\c.mp3')[0]
+    assert '\\' not in app.parse_filename('a/b\\c.mp3')[0]
+    assert app._UNSAFE_FILENAME_CHARS.sub('_', 'ok-name_1.2') == 'ok-name_1.2'
+
+
+@pytest.mark.parametrize('line, seconds', [
+    ('  Duration: 00:03:25.47, start: 0.025057, bitrate: 320 kb/s', 205.47),
+    ('  Duration: 01:00:00.00, start: 0.000000, bitrate: 1411 kb/s', 3600.0),
+    ('  Duration: 00:12:00.5, start: 0.000000', 720.5),
+])
+def test_parse_input_duration(line, seconds):
+    assert app.parse_input_duration(line) == pytest.approx(seconds)
+
+
+@pytest.mark.parametrize('line', [
+    '  Duration: N/A, start: 0.000000, bitrate: N/A',
+    'Stream #0:0: Audio: mp3, 44100 Hz, stereo, fltp, 320 kb/s',
+    '',
+])
+def test_parse_input_duration_without_duration(line):
+    assert app.parse_input_duration(line) is None
+
+
+class FakeRedis:
+    """Just enough of redis.Redis for the upload helpers, with GETRANGE's semantics.
+
+    Expiry is not simulated; tests drop keys themselves.
+    """
+
+    def __init__(self, values=None):
+        self.values = dict(values or {})
+        self.zsets = {}
+        self.hashes = {}
+        self.ranges = []
+
+    def pipeline(self):
+        return FakePipeline(self)
+
+    def set(self, key, value, ex=None):
+        self.values[key] = bytes(value)
+
+    def append(self, key, value):
+        self.values[key] = self.values.get(key, b'') + value
+
+    def delete(self, *keys):
+        return sum(self.values.pop(key, None) is not None for key in keys)
+
+    def strlen(self, key):
+        return len(self.values.get(key, b''))
+
+    def getrange(self, key, start, end):
+        self.ranges.append((start, end))
+        data = self.values.get(key, b'')
+        size = len(data)
+        if start < 0:
+            start = max(0, size + start)
+        if end < 0:
+            end = size + end
+        return data[start:min(end, size - 1) + 1]
+
+    def zadd(self, key, mapping):
+        self.zsets.setdefault(key, {}).update(mapping)
+
+    def zrangebyscore(self, key, low, high):
+        return [member for member, score in self.zsets.get(key, {}).items() if score <= high]
+
+    def zrem(self, key, *members):
+        for member in members:
+            self.zsets.get(key, {}).pop(member, None)
+
+    def hset(self, key, field, value):
+        self.hashes.setdefault(key, {})[field] = str(value).encode()
+
+    def hdel(self, key, *fields):
+        for field in fields:
+            self.hashes.get(key, {}).pop(field, None)
+
+    def hvals(self, key):
+        return list(self.hashes.get(key, {}).values())
+
+
+class FakePipeline:
+    """Queues FakeRedis calls until execute(), like a redis-py pipeline"""
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.calls = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+    def __getattr__(self, name):
+        def queue_call(*args, **kwargs):
+            self.calls.append((getattr(self.connection, name), args, kwargs))
+            return self
+        return queue_call
+
+    def execute(self):
+        return [method(*args, **kwargs) for method, args, kwargs in self.calls]
+
+
+def test_redis_blob_reader_reads_whole_value():
+    data = bytes(range(256)) * 40
+    reader = app.RedisBlobReader(FakeRedis({'in:x': data}), 'in:x')
+
+    assert len(reader) == len(data)
+    assert reader.read() == data
+    assert reader.read(10) == b''
+
+
+def test_redis_blob_reader_never_requests_past_the_end():
+    connection = FakeRedis({'in:x': b'0123456789'})
+    reader = app.RedisBlobReader(connection, 'in:x')
+
+    assert reader.read(4) == b'0123'
+    assert reader.read(100) == b'456789'
+    assert reader.read(4) == b''
+    assert connection.ranges == [(0, 3), (4, 9)]
+
+
+def test_redis_blob_reader_seek():
+    reader = app.RedisBlobReader(FakeRedis({'in:x': b'0123456789'}), 'in:x')
+
+    assert reader.seek(3) == 3
+    assert reader.read(2) == b'34'
+    assert reader.seek(-2, io.SEEK_CUR) == 3
+    assert reader.seek(-4, io.SEEK_END) == 6
+    assert reader.read() == b'6789'
+    assert reader.seek(-100, io.SEEK_CUR) == 0
+    assert reader.tell() == 0
+    assert reader.seek(50) == 50
+    assert reader.read(4) == b''
+
+
+def test_redis_blob_reader_empty_reads():
+    connection = FakeRedis({'in:x': b'0123456789'})
+    reader = app.RedisBlobReader(connection, 'in:x')
+
+    assert reader.readinto(bytearray()) == 0
+    assert reader.read(0) == b''
+    assert connection.ranges == []
+    assert app.RedisBlobReader(FakeRedis({'in:x': b''}), 'in:x').read() == b''
+
+
+@pytest.fixture
+def fake_redis(monkeypatch, tmp_path):
+    connection = FakeRedis()
+    monkeypatch.setattr(app, 'redis_conn', connection, raising=False)
+    monkeypatch.setattr(app, 'MAX_QUEUED_BYTES', 1000)
+    monkeypatch.setattr(app, 'COPY_BUFFER_SIZE', 64)
+    return connection
+
+
+def upload_file(tmp_path, name, size):
+    path = tmp_path / name
+    path.write_bytes(bytes(range(256)) * (size // 256) + bytes(size % 256))
+    return str(path)
+
+
+def test_store_upload_copies_file_and_counts_its_size(fake_redis, tmp_path):
+    path = upload_file(tmp_path, 'a.mp3', 600)
+
+    assert app.store_upload(path, 'in:a')
+
+    assert fake_redis.values['in:a'] == open(path, 'rb').read()
+    assert app.queued_upload_bytes(fake_redis) == 600
+
+
+def test_store_upload_refuses_uploads_over_the_budget(fake_redis, tmp_path):
+    assert app.store_upload(upload_file(tmp_path, 'a.mp3', 600), 'in:a')
+
+    assert not app.store_upload(upload_file(tmp_path, 'b.mp3', 600), 'in:b')
+
+    assert 'in:b' not in fake_redis.values
+    assert app.queued_upload_bytes(fake_redis) == 600
+
+
+def test_release_upload_returns_bytes_to_the_budget(fake_redis, tmp_path):
+    assert app.store_upload(upload_file(tmp_path, 'a.mp3', 600), 'in:a')
+
+    app.release_upload(fake_redis, 'in:a')
+
+    assert 'in:a' not in fake_redis.values
+    assert app.queued_upload_bytes(fake_redis) == 0
+    assert app.store_upload(upload_file(tmp_path, 'b.mp3', 600), 'in:b')
+
+
+def test_release_upload_after_the_upload_expired(fake_redis, tmp_path):
+    assert app.store_upload(upload_file(tmp_path, 'a.mp3', 600), 'in:a')
+    del fake_redis.values['in:a']  # Expired before a worker reached it
+
+    app.release_upload(fake_redis, 'in:a')
+
+    assert app.queued_upload_bytes(fake_redis) == 0
+
+
+def test_queued_upload_bytes_drops_expired_uploads(fake_redis, tmp_path, monkeypatch):
+    # A job that was killed never releases its upload
+    assert app.store_upload(upload_file(tmp_path, 'a.mp3', 600), 'in:a')
+
+    later = time.time() + app.INPUT_TTL + 1
+    monkeypatch.setattr(app.time, 'time', lambda: later)
+
+    assert app.queued_upload_bytes(fake_redis) == 0
+    assert app.store_upload(upload_file(tmp_path, 'b.mp3', 600), 'in:b')
+
+
+def test_store_upload_releases_on_write_failure(fake_redis, tmp_path, monkeypatch):
+    def fail(key, value):
+        raise ConnectionError('lost connection')
+    monkeypatch.setattr(fake_redis, 'append', fail)
+
+    with pytest.raises(ConnectionError):
+        app.store_upload(upload_file(tmp_path, 'a.mp3', 600), 'in:a')
+
+    assert 'in:a' not in fake_redis.values
+    assert app.queued_upload_bytes(fake_redis) == 0
+
+
+def test_start_processing_releases_upload_when_enqueue_fails(fake_redis, tmp_path, monkeypatch):
+    class FailingQueue:
+        def enqueue(self, *args, **kwargs):
+            raise ConnectionError('lost connection')
+    monkeypatch.setattr(app, 'USE_REDIS', True)
+    monkeypatch.setattr(app, 'queue', FailingQueue(), raising=False)
+    input_path = upload_file(tmp_path, 'input_1_a.mp3', 600)
+
+    with app.app.app_context(), pytest.raises(ConnectionError):
+        app.start_processing(input_path, str(tmp_path / 'output_1_a.mp3'), 1.0, 1.0)
+
+    assert fake_redis.values == {}
+    assert app.queued_upload_bytes(fake_redis) == 0
+
+
+# MPEG-1 Layer III, 128 kbps, 44.1 kHz, stereo: 417 byte frames of 1152 samples
+MP3_FRAME = b'\xff\xfb\x90\x00' + bytes(413)
+
+
+def test_get_audio_duration_estimates_cbr_mp3_after_id3_tag(tmp_path):
+    path = tmp_path / 'song.mp3'
+    path.write_bytes(b'ID3\x03\x00\x00\x00\x00\x00\x0a' + bytes(10) + MP3_FRAME * 1000)
+
+    assert app.get_audio_duration(str(path)) == pytest.approx(1000 * 1152 / 44100, rel=0.01)
+
+
+def test_get_audio_duration_reads_xing_frame_count(tmp_path):
+    path = tmp_path / 'song.mp3'
+    frame = bytearray(MP3_FRAME)
+    # Stereo MPEG-1: the Xing tag follows the 4 byte header and 32 bytes of side info
+    frame[36:48] = b'Xing' + struct.pack('>II', 0x1, 50000)
+    path.write_bytes(bytes(frame) + MP3_FRAME * 10)
+
+    assert app.get_audio_duration(str(path)) == pytest.approx(50000 * 1152 / 44100)
+
+
+def test_get_audio_duration_wav(tmp_path):
+    path = tmp_path / 'song.wav'
+    write_wav(path, frames=bytes(4 * 22050), rate=22050)
+
+    assert app.get_audio_duration(str(path)) == pytest.approx(1.0)
+
+
+@pytest.mark.parametrize('format_tag, bits', [(3, 32), (0xFFFE, 24)])
+def test_get_audio_duration_non_pcm_wav(tmp_path, format_tag, bits):
+    path = tmp_path / 'song.wav'
+    path.write_bytes(riff_wav(format_tag, 8000, bits=bits, data=bytes(8000 * 2 * bits // 8)))
+
+    assert app.get_audio_duration(str(path)) == pytest.approx(1.0)
+
+
+@pytest.mark.parametrize('data_size', [0, 0xFFFFFFFF])
+def test_get_audio_duration_streaming_wav_is_unknown(tmp_path, data_size):
+    path = tmp_path / 'song.wav'
+    path.write_bytes(riff_wav(1, 8000, bits=16, data=bytes(32000), data_size=data_size))
+
+    assert app.get_audio_duration(str(path)) is None
+
+
+def test_get_audio_duration_truncated_wav_counts_frames_present(tmp_path):
+    path = tmp_path / 'song.wav'
+    # Header claims 10 seconds, the file holds 1
+    path.write_bytes(riff_wav(1, 8000, bits=16, data=bytes(32000), data_size=320000))
+
+    assert app.get_audio_duration(str(path)) == pytest.approx(1.0)
+
+
+def test_get_audio_duration_unknown(tmp_path):
+    path = tmp_path / 'song.mp3'
+    path.write_bytes(b'not audio' * 100)
+
+    assert app.get_audio_duration(str(path)) is None
+
+
+@pytest.fixture
+def client():
+    app.app.config['TESTING'] = True
+    with app.app.test_client() as client:
+        yield client
+
+
+def wav_bytes(tmp_path, seconds=1, rate=8000):
+    path = tmp_path / 'body.wav'
+    write_wav(path, frames=bytes(4 * rate * seconds), rate=rate)
+    return path.read_bytes()
+
+
+def test_process_raw_rejects_body_over_max_content_length(client, tmp_path, monkeypatch):
+    monkeypatch.setitem(app.app.config, 'MAX_CONTENT_LENGTH', 1024 * 1024)
+    body = wav_bytes(tmp_path, seconds=40)
+    assert len(body) > 1024 * 1024
+
+    response = client.post('/process-raw?filename=song.wav&mode=fast', data=body,
+                           content_type='application/octet-stream')
+
+    assert response.status_code == 413
+    assert not any(name.startswith('input_') for name in os.listdir(app.TEMP_DIR))
+
+
+def test_process_raw_fast_wav(client, tmp_path):
+    response = client.post('/process-raw?filename=song.wav&mode=fast&speed=1.5',
+                           data=wav_bytes(tmp_path), content_type='application/octet-stream')
+
+    assert response.status_code == 200
+    download = client.get(response.get_json()['download_url'])
+    assert download.status_code == 200
+    assert download.mimetype == 'audio/wav'
+    with wave.open(io.BytesIO(download.data), 'rb') as w:
+        assert w.getframerate() == 12000
+
+
+def test_process_raw_rejects_long_piped_mp3_before_streaming(client, monkeypatch):
+    def no_ffmpeg(*args, **kwargs):
+        raise AssertionError('FFmpeg should not run')
+    monkeypatch.setattr(app, 'stream_audio_with_ffmpeg', no_ffmpeg)
+    # 20 minutes of 32 kbps CBR frames with no Xing tag: 104 bytes per 1152 samples
+    frame = b'\xff\xfb\x10\x00' + bytes(100)
+    body = frame * int(20 * 60 * 44100 / 1152)
+
+    response = client.post('/process-raw?filename=song.mp3', data=body,
+                           content_type='application/octet-stream')
+
+    assert response.status_code == 400
+    assert 'exceeds 12 minutes' in response.get_json()['error']
+
+
+def test_prefixed_stream_replays_prefix_then_rest():
+    stream = app.PrefixedStream(b'0123', io.BytesIO(b'456789'))
+
+    assert stream.read(3) == b'012'
+    assert stream.read(3) == b'3'
+    assert stream.read() == b'456789'
+    assert stream.read(3) == b''
+
+
+STUB_FFMPEG = '''#!{python}
+import os, sys, time
+mode = os.environ.get('STUB_FFMPEG_MODE', 'ok')
+if mode == 'hang':
+    time.sleep(60)
+if sys.argv[sys.argv.index('-i') + 1] == 'pipe:0':
+    sys.stdin.buffer.read()
+sys.stderr.write('Input #0, wav:\\n  Duration: %s, bitrate: 128 kb/s\\n' % os.environ.get('STUB_FFMPEG_DURATION', '00:00:01.00'))
+if mode == 'fail':
+    sys.stderr.write('Invalid data found when processing input\\n')
+    sys.exit(1)
+sys.stderr.write('Stream mapping:\\n')
+sys.stderr.flush()
+sys.stdout.buffer.write(b'out-')
+sys.stdout.flush()
+if mode == 'slow':
+    time.sleep(60)
+sys.stdout.buffer.write(b'0123456789' * 10000)
+'''
+
+
+@pytest.fixture
+def stub_ffmpeg(tmp_path, monkeypatch):
+    """Point FFMPEG_BIN at a script that mimics FFmpeg's stderr header and piped output"""
+    path = tmp_path / 'ffmpeg'
+    path.write_text(STUB_FFMPEG.format(python=sys.executable))
+    path.chmod(0o755)
+    monkeypatch.setattr(app, 'FFMPEG_BIN', str(path))
+
+    def set_mode(mode='ok', duration='00:00:01.00'):
+        monkeypatch.setenv('STUB_FFMPEG_MODE', mode)
+        monkeypatch.setenv('STUB_FFMPEG_DURATION', duration)
+    set_mode()
+    yield set_mode
+    assert free_ffmpeg_slots() == app.FFMPEG_SLOTS
+
+
+STUB_OUTPUT = b'out-' + b'0123456789' * 10000
+
+
+def free_ffmpeg_slots():
+    count = 0
+    while app._ffmpeg_semaphore.acquire(blocking=False):
+        count += 1
+    for _ in range(count):
+        app._ffmpeg_semaphore.release()
+    return count
+
+
+def test_stream_audio_with_ffmpeg_relays_output(stub_ffmpeg, tmp_path):
+    path = tmp_path / 'in.wav'
+    write_wav(path)
+
+    audio = app.stream_audio_with_ffmpeg(str(path), 'wav', 1.15, 1.0)
+    try:
+        assert b''.join(audio) == STUB_OUTPUT
+    finally:
+        audio.close()
+
+
+def test_stream_audio_with_ffmpeg_feeds_stdin(stub_ffmpeg):
+    audio = app.stream_audio_with_ffmpeg(io.BytesIO(b'\0' * 100000), 'mp3', 1.15, 1.0)
+    try:
+        assert b''.join(audio) == STUB_OUTPUT
+    finally:
+        audio.close()
+
+
+def test_stream_audio_with_ffmpeg_rejects_long_input(stub_ffmpeg, tmp_path):
+    stub_ffmpeg(duration='00:13:00.00')
+    path = tmp_path / 'in.wav'
+    write_wav(path)
+
+    with pytest.raises(app.AudioTooLongError):
+        app.stream_audio_with_ffmpeg(str(path), 'wav', 1.15, 1.0)
+
+
+def test_stream_audio_with_ffmpeg_failed_decode(stub_ffmpeg, tmp_path):
+    stub_ffmpeg('fail')
+    path = tmp_path / 'in.wav'
+    write_wav(path)
+
+    assert app.stream_audio_with_ffmpeg(str(path), 'wav', 1.15, 1.0) is None
+
+
+def test_stream_audio_with_ffmpeg_header_timeout(stub_ffmpeg, tmp_path, monkeypatch):
+    stub_ffmpeg('hang')
+    monkeypatch.setattr(app, 'HEADER_TIMEOUT', 0.5)
+    path = tmp_path / 'in.wav'
+    write_wav(path)
+
+    started = time.monotonic()
+    assert app.stream_audio_with_ffmpeg(str(path), 'wav', 1.15, 1.0) is None
+    assert time.monotonic() - started < 10
+
+
+def test_transcode_stream_close_before_iteration_stops_ffmpeg(stub_ffmpeg, tmp_path):
+    stub_ffmpeg('slow')
+    path = tmp_path / 'in.wav'
+    write_wav(path)
+
+    audio = app.stream_audio_with_ffmpeg(str(path), 'wav', 1.15, 1.0)
+    started = time.monotonic()
+    audio.close()
+
+    assert time.monotonic() - started < 10
+    assert audio._process.returncode == -9
+
+
+def test_process_audio_streams_result(client, stub_ffmpeg, tmp_path):
+    response = client.post('/process-audio', data={
+        'file': (io.BytesIO(wav_bytes(tmp_path)), 'song.wav'),
+        'speed': '1.15',
+    }, content_type='multipart/form-data')
+
+    assert response.status_code == 200
+    assert response.mimetype == 'audio/wav'
+    assert response.headers['Content-Disposition'].startswith('attachment; filename=output_')
+    assert response.data == STUB_OUTPUT
+    response.close()
+    assert not any(name.startswith('input_') for name in os.listdir(app.TEMP_DIR))
+
+
+def test_process_raw_streams_result(client, stub_ffmpeg, tmp_path):
+    response = client.post('/process-raw?filename=song.wav', data=wav_bytes(tmp_path),
+                           content_type='application/octet-stream')
+
+    assert response.status_code == 200
+    assert response.mimetype == 'audio/wav'
+    assert response.data == STUB_OUTPUT
+    response.close()
+
+
+def test_process_audio_too_long(client, stub_ffmpeg, tmp_path):
+    stub_ffmpeg(duration='00:13:00.00')
+
+    response = client.post('/process-audio', data={
+        'file': (io.BytesIO(wav_bytes(tmp_path)), 'song.wav'),
+    }, content_type='multipart/form-data')
+
+    assert response.status_code == 400
+    assert 'exceeds 12 minutes' in response.get_json()['error']
+
+
+def test_process_audio_failed_decode(client, stub_ffmpeg, tmp_path):
+    stub_ffmpeg('fail')
+
+    response = client.post('/process-audio', data={
+        'file': (io.BytesIO(wav_bytes(tmp_path)), 'song.wav'),
+    }, content_type='multipart/form-data')
+
+    assert response.status_code == 500
+    assert response.get_json()['error'] == 'Failed to process audio'
+
+
+def test_sweep_temp_dir_cutoffs(tmp_path, monkeypatch):
+    monkeypatch.setattr(app, 'TEMP_DIR', tmp_path)
+    now = time.time()
+    ages = {
+        'output_1_song.mp3': app.RESULT_TTL + 10,  # Download link expired
+        'output_2_song.mp3': app.RESULT_TTL - 10,
+        'output_3_song.mp3.part': app.RESULT_TTL + 10,  # Still being written
+        'output_4_song.mp3.part': app.TEMP_FILE_MAX_AGE + 10,
+        'input_5_song.mp3': app.TEMP_FILE_MAX_AGE - 10,
+        'input_6_song.mp3': app.TEMP_FILE_MAX_AGE + 10,
+        '.upload-abc': app.TEMP_FILE_MAX_AGE + 10,
+        '.ffmpeg-slot-0.lock': app.TEMP_FILE_MAX_AGE * 100,
+        '.janitor.lock': app.TEMP_FILE_MAX_AGE * 100,
+    }
+    for name, age in ages.items():
+        path = tmp_path / name
+        path.touch()
+        os.utime(path, (now - age, now - age))
+    (tmp_path / 'subdir').mkdir()
+
+    app.sweep_temp_dir()
+
+    assert sorted(os.listdir(tmp_path)) == sorted([
+        'output_2_song.mp3',
+        'output_3_song.mp3.part',
+        'input_5_song.mp3',
+        '.ffmpeg-slot-0.lock',
+        '.janitor.lock',
+        'subdir',
+    ])